@@ -1,11 +1,13 @@
 from telebot import TeleBot
-from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
+from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto
 from logic import * 
 import schedule
 import threading
 import time
 import os
+import io
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 try:
     from config import API_TOKEN, DATABASE
@@ -15,49 +17,107 @@ except ImportError:
     print("Создайте config.py и добавьте строки: API_TOKEN = 'ВАШ_ТОКЕН', DATABASE = 'telegram_bot.db'")
     exit()
 
-bot = TeleBot(API_TOKEN)
+try:
+    from config import STORAGE
+except ImportError:
+    STORAGE = 'sqlite'
 
-manager = DatabaseManager(DATABASE)
+try:
+    from config import DISPATCH_WORKERS, CLAIM_WORKERS
+except ImportError:
+    DISPATCH_WORKERS, CLAIM_WORKERS = 4, 16
 
-manager.create_tables()
+try:
+    from config import SENDER_WORKERS, BROADCAST_RATE
+except ImportError:
+    SENDER_WORKERS, BROADCAST_RATE = 8, 25
 
 try:
-    img_dir = 'img'
-    if os.path.exists(img_dir):
-        prizes_img = [f for f in os.listdir(img_dir) if os.path.isfile(os.path.join(img_dir, f)) and f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-        data = [(x,) for x in prizes_img]
+    from config import BACKUP_INTERVAL_HOURS, ARCHIVE_INTERVAL_HOURS
+except ImportError:
+    BACKUP_INTERVAL_HOURS, ARCHIVE_INTERVAL_HOURS = 24, 1
 
-        if data:
-            manager.add_prize(data)
-        else:
-            print(f"Каталог '{img_dir}' пуст или не содержит файлов изображений (.png, .jpg, .jpeg). Призы не добавлены.")
-    else:
-        print(f"Ошибка: Каталог '{img_dir}' не найден. Призы не могут быть добавлены. Создайте каталог '{img_dir}' и поместите туда изображения.")
+try:
+    from config import CAMPAIGNS
+except ImportError:
+    CAMPAIGNS = [{'name': 'main', 'database': DATABASE}]
+
+# Обработчики выполняются в потоках UpdateDispatcher, поэтому собственный пул потоков telebot не нужен
+bot = TeleBot(API_TOKEN, threaded=False)
+
+campaigns = [create_campaign(settings, STORAGE) for settings in CAMPAIGNS]
+campaigns_by_name = {campaign.name: campaign for campaign in campaigns}
+
+if not campaigns or len(campaigns_by_name) != len(campaigns):
+    print("Ошибка: CAMPAIGNS в config.py должен содержать хотя бы один розыгрыш, а имена розыгрышей не должны повторяться.")
+    exit()
+
+# Общие для всех розыгрышей потоки рассылки и ограничитель скорости отправки
+sender_pool = ThreadPoolExecutor(max_workers=SENDER_WORKERS)
+rate_limiter = RateLimiter(rate=BROADCAST_RATE)
+image_cache = ImageCache(max_bytes=64 * 1024 * 1024)
+# Ответы на /start отправляются отдельными потоками: в sender_pool они ждали бы за всей очередью рассылки
+reply_pool = ThreadPoolExecutor(max_workers=4)
+
+for campaign in campaigns:
+    campaign.load_prizes()
+
+
+def parse_callback_data(data):
+    # "<розыгрыш>:<prize_id>". Кнопки, отправленные до появления розыгрышей, содержат только prize_id и относятся к первому розыгрышу.
+    if not data:
+        raise ValueError("пустые данные кнопки")
+    campaign_name, _, prize_id = data.rpartition(':')
+    campaign = campaigns_by_name.get(campaign_name) if campaign_name else campaigns[0]
+    if campaign is None:
+        raise ValueError(f"неизвестный розыгрыш '{campaign_name}'")
+    return campaign, int(prize_id)
 
-except Exception as e:
-    print(f"Произошла ошибка при добавлении призов из каталога '{img_dir}': {e}")
+
+def register_claim(call):
+    # on_callback диспетчера: нажатие встает в пачку еще в потоке поллинга, обработчик только ждет call.claim_future
+    try:
+        campaign, prize_id = parse_callback_data(call.data)
+    except ValueError:
+        return
+    if call.message is None:
+        return
+    call.claim_future = campaign.register_claim(call.message.chat.id, prize_id)
 
 
-def gen_markup(prize_id):
+# Обработчик нажатий ждет разбора пачки (ClaimBatcher), поэтому потоков для нажатий больше, чем для команд
+dispatcher = UpdateDispatcher(bot, workers=DISPATCH_WORKERS, claim_workers=CLAIM_WORKERS, on_callback=register_claim)
+
+
+def gen_markup(campaign, prize_id):
     markup = InlineKeyboardMarkup()
     markup.row_width = 1
-    markup.add(InlineKeyboardButton("Получить!", callback_data=str(prize_id)))
+    markup.add(InlineKeyboardButton("Получить!", callback_data=campaign.callback_data(prize_id)))
     return markup
 
 @bot.callback_query_handler(func=lambda call: True)
 def callback_query(call):
-    bot.answer_callback_query(call.id)
-
     try:
-        prize_id = int(call.data)
+        campaign, prize_id = parse_callback_data(call.data)
     except ValueError:
+        bot.answer_callback_query(call.id)
         print(f"Некорректные данные обратного вызова: {call.data}")
         bot.send_message(call.message.chat.id, "Произошла ошибка при обработке запроса приза. Попробуйте позже.")
         return
 
     user_id = call.message.chat.id 
+    manager = campaign.storage
 
-    add_status = manager.add_winner(user_id, prize_id)
+    # Нажатие уже зарегистрировано в register_claim (поток поллинга); если обновление пришло не через dispatcher,
+    # регистрируем здесь, до ответа Telegram.
+    claim_future = getattr(call, 'claim_future', None)
+    if claim_future is None:
+        claim_future = campaign.register_claim(user_id, prize_id)
+    bot.answer_callback_query(call.id)
+
+    add_status = claim_future.result()
+    if add_status == -3:
+        return
 
     if add_status == 1:
         img_filename = manager.get_prize_img(prize_id)
@@ -68,11 +128,11 @@ def callback_query(call):
                 print(f"Не удалось удалить сообщение {call.message.message_id} в чате {call.message.chat.id}: {e}")
 
             try:
-                image_path = f'img/{img_filename}'
-                if os.path.exists(image_path):
-                     with open(image_path, 'rb') as photo:
-                          bot.send_photo(user_id, photo, caption="Поздравляем! Вы получили этот приз!")
-                     print(f"Пользователь {user_id} получил приз ID {prize_id}.")
+                image_path = campaign.prize_img_path(img_filename)
+                photo = image_cache.open(image_path)
+                if photo is not None:
+                     bot.send_photo(user_id, photo, caption="Поздравляем! Вы получили этот приз!")
+                     print(f"[{campaign.name}] Пользователь {user_id} получил приз ID {prize_id}.")
                 else:
                      bot.send_message(user_id, "Поздравляем! Вы получили приз, но файл изображения не найден на сервере.")
                      print(f"Ошибка: Файл изображения приза не найден на сервере при отправке победителю: {image_path} (Приз ID: {prize_id})")
@@ -121,23 +181,24 @@ def callback_query(call):
             print(f"Не удалось отредактировать сообщение {call.message.message_id} (приз забран): {e}")
 
 
-def send_message():
-    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Планировщик: Попытка отправить новый приз.")
+def send_message(campaign):
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Планировщик [{campaign.name}]: Попытка отправить новый приз.")
 
+    manager = campaign.storage
     available_prize = manager.get_random_prize()
 
     if available_prize:
         prize_id, img_filename = available_prize
 
-        source_img_path = f'img/{img_filename}'
-        hidden_img_path = f'hidden_img/{img_filename}'
+        source_img_path = os.path.join(campaign.img_dir, img_filename)
+        hidden_img_path = campaign.hidden_img_path(img_filename)
 
         if not os.path.exists(source_img_path):
              print(f"Ошибка [send_message]: Исходный файл приза не найден: {source_img_path}. Пропуск отправки приза ID {prize_id}.")
              return
 
         try:
-            hide_img(img_filename)
+            campaign.prepare_prize_images(img_filename)
         except Exception as e:
             print(f"Ошибка [send_message]: при создании скрытого изображения для {img_filename} (Приз ID: {prize_id}): {e}. Пропуск отправки.")
             return
@@ -145,42 +206,99 @@ def send_message():
         if not os.path.exists(hidden_img_path):
              print(f"Ошибка [send_message]: Не удалось создать скрытое изображение: {hidden_img_path}. Пропуск отправки приза ID {prize_id}.")
              return
-        users = manager.get_users()
+
+        # Победители получат оригинал в течение нескольких секунд, поэтому обе версии загружаются в кэш заранее
+        image_cache.prewarm([campaign.prize_img_path(img_filename), hidden_img_path])
+
+        users = [user_id for user_id in manager.get_users() if campaign.accepts(user_id)]
         if not users:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Планировщик: Нет зарегистрированных пользователей для отправки приза.")
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Планировщик [{campaign.name}]: Нет зарегистрированных пользователей для отправки приза.")
             return
 
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Планировщик: Отправка приза ID {prize_id} ({img_filename}) {len(users)} пользователям...")
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Планировщик [{campaign.name}]: Отправка приза ID {prize_id} ({img_filename}) {len(users)} пользователям...")
 
         try:
-            with open(hidden_img_path, 'rb') as photo_file:
-                for user_id in users:
-                    try:
-                         photo_file.seek(0)
-                         bot.send_photo(user_id, photo_file, caption="Новый приз доступен! Успей получить!", reply_markup=gen_markup(prize_id))
+            hidden_img_bytes = image_cache.get(hidden_img_path)
+            if hidden_img_bytes is None:
+                raise FileNotFoundError(hidden_img_path)
 
-                    except Exception as e:
-                         print(f"Ошибка [send_message]: Не удалось отправить сообщение пользователю {user_id} для приза {prize_id}: {e}")
+            # Рассылка идет в общем пуле потоков, чтобы планировщик не ждал ее окончания и розыгрыши не задерживали друг друга
+            markup = gen_markup(campaign, prize_id)
+            for user_id in users:
+                sender_pool.submit(send_prize_photo, user_id, prize_id, hidden_img_bytes, markup)
 
         except FileNotFoundError:
              print(f"Критическая ошибка [send_message]: Файл скрытого изображения внезапно исчез: {hidden_img_path}. Пропуск отправки приза ID {prize_id}.")
         except Exception as e:
              print(f"Произошла общая ошибка [send_message]: при отправке скрытых изображений приза ID {prize_id}: {e}")
         finally:
-            pass
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Планировщик: Кэш изображений: {image_cache.stats()}")
 
 
     else:
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Планировщик: Нет доступных неиспользованных призов для отправки.")
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Планировщик [{campaign.name}]: Нет доступных неиспользованных призов для отправки.")
+
+
+def send_prize_photo(user_id, prize_id, photo_bytes, markup):
+    rate_limiter.acquire()
+    try:
+         bot.send_photo(user_id, io.BytesIO(photo_bytes), caption="Новый приз доступен! Успей получить!", reply_markup=markup)
+
+    except Exception as e:
+         print(f"Ошибка [send_message]: Не удалось отправить сообщение пользователю {user_id} для приза {prize_id}: {e}")
+
+
+def log_dispatcher_stats():
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Очереди обновлений: {dispatcher.queue_depths()}")
+
+
+def run_maintenance(task):
+    # Обслуживание БД выполняется в отдельном потоке, чтобы не задерживать рассылку призов в потоке планировщика
+    threading.Thread(target=task, daemon=True).start()
 
 
 def shedule_thread():
-    schedule.every(30).minutes.do(send_message)
-    print("Планировщик запущен, отправка призов каждые 30 минут.")
+    for campaign in campaigns:
+        schedule.every(campaign.interval_minutes).minutes.do(send_message, campaign)
+        print(f"Планировщик запущен для розыгрыша '{campaign.name}', отправка призов каждые {campaign.interval_minutes} минут.")
+        if campaign.maintenance is not None:
+            schedule.every(BACKUP_INTERVAL_HOURS).hours.do(run_maintenance, campaign.maintenance.backup)
+            schedule.every(ARCHIVE_INTERVAL_HOURS).hours.do(run_maintenance, campaign.maintenance.archive_finished_prizes)
+    schedule.every(5).minutes.do(log_dispatcher_stats)
     while True:
         schedule.run_pending()
         time.sleep(1)
 
+
+def command_campaign(message):
+    # Розыгрыш из аргумента команды (например, "/rating cats"), по умолчанию - первый.
+    args = (message.text or '').split()[1:]
+    if not args:
+        return campaigns[0]
+    campaign = campaigns_by_name.get(args[0])
+    if campaign is None:
+        bot.reply_to(message, f"Розыгрыш '{args[0]}' не найден. Доступные розыгрыши: {', '.join(campaigns_by_name)}")
+    return campaign
+
+
+def welcome_text(joined):
+    if len(joined) == 1:
+        campaign = joined[0]
+        return f"""Привет!
+Тебя успешно зарегистрировали!
+Каждые {campaign.interval_minutes} минут тебе будут приходить новые картинки и у тебя будет шанс их получить!
+Для этого нужно быстрее всех нажать на кнопку 'Получить!'
+
+Только первые {campaign.prize_limit} пользователя(ей) получат картинку!)"""
+
+    lines = "\n".join(f"- {campaign.name}: новая картинка каждые {campaign.interval_minutes} минут, получат первые {campaign.prize_limit} пользователя(ей)" for campaign in joined)
+    return f"""Привет!
+Тебя успешно зарегистрировали в розыгрышах:
+{lines}
+
+Чтобы получить картинку, нужно быстрее всех нажать на кнопку 'Получить!'"""
+
+
 @bot.message_handler(commands=['start'])
 def handle_start(message):
     user_id = message.chat.id
@@ -188,22 +306,48 @@ def handle_start(message):
     if not user_name:
         user_name = message.from_user.username or f"user_{user_id}"
 
-    if manager.add_user(user_id, user_name):
-        bot.reply_to(message, """Привет!
-Тебя успешно зарегистрировали!
-Каждые 30 минут тебе будут приходить новые картинки и у тебя будет шанс их получить!
-Для этого нужно быстрее всех нажать на кнопку 'Получить!'
+    available = [campaign for campaign in campaigns if campaign.accepts(user_id)]
+    if not available:
+        bot.reply_to(message, "Сейчас нет розыгрышей, в которых ты можешь участвовать.")
+        print(f"Пользователь {user_id} не входит в аудиторию ни одного розыгрыша.")
+        return
 
-Только три первых пользователя получат картинку!)""")
-        print(f"Новый пользователь зарегистрирован: ID={user_id}, Name='{user_name}'")
-    else:
-        bot.reply_to(message, "Ты уже зарегистрирован!")
-        print(f"Пользователь {user_id} уже зарегистрирован.")
+    # Регистрации уходят в пачки без ожидания: поток обработчика сразу освобождается, а ответ отправляется
+    # из reply_pool, когда запишутся все пачки с этим пользователем.
+    futures = [campaign.registrations.submit(user_id, user_name) for campaign in available]
+    pending = [len(futures)]
+    pending_lock = threading.Lock()
+
+    def on_registered(_):
+        with pending_lock:
+            pending[0] -= 1
+            if pending[0]:
+                return
+        reply_pool.submit(reply_start, message, user_id, user_name, available, futures)
+
+    for future in futures:
+        future.add_done_callback(on_registered)
+
+def reply_start(message, user_id, user_name, available, futures):
+    try:
+        joined = [campaign for campaign, future in zip(available, futures) if future.result()]
+        if joined:
+            bot.reply_to(message, welcome_text(joined))
+            print(f"Новый пользователь зарегистрирован: ID={user_id}, Name='{user_name}', розыгрыши: {[campaign.name for campaign in joined]}")
+        else:
+            bot.reply_to(message, "Ты уже зарегистрирован!")
+            print(f"Пользователь {user_id} уже зарегистрирован.")
+    except Exception as e:
+        print(f"Ошибка при регистрации пользователя {user_id}: {e}")
 
 @bot.message_handler(commands=['rating'])
 def handle_rating(message):
-    print(f"Пользователь {message.chat.id} запросил рейтинг.")
-    rating_list = manager.get_rating()
+    campaign = command_campaign(message)
+    if campaign is None:
+        return
+
+    print(f"Пользователь {message.chat.id} запросил рейтинг розыгрыша '{campaign.name}'.")
+    rating_list = campaign.storage.get_rating()
 
     if not rating_list:
         bot.reply_to(message, "Рейтинг пока пуст. Никто еще не выигрывал призы!")
@@ -227,32 +371,53 @@ def handle_rating(message):
 @bot.message_handler(commands=['my_score'])
 def handle_my_score(message):
     user_id = message.chat.id
-    print(f"Пользователь {user_id} запросил коллаж призов.")
-
-    collage_image = create_collage(user_id, manager)
-
-    if collage_image is None:
-        bot.reply_to(message, "Пока нет призов для создания коллажа, или произошла ошибка при его создании (возможно, в базе данных нет призов).")
+    campaign = command_campaign(message)
+    if campaign is None:
         return
 
-    temp_filename = f'collage_{user_id}.png'
+    print(f"Пользователь {user_id} запросил коллаж призов розыгрыша '{campaign.name}'.")
+
+    pages_sent = 0
+    media = []
     try:
-        cv2.imwrite(temp_filename, collage_image)
-        
-        with open(temp_filename, 'rb') as photo:
-            bot.send_photo(user_id, photo, caption="Ваш коллаж призов:")
-        print(f"Коллаж отправлен пользователю {user_id}.")
+        for page in campaign.iter_collage_pages(user_id):
+            ok, encoded = cv2.imencode('.jpg', page, [cv2.IMWRITE_JPEG_QUALITY, 90])
+            if not ok:
+                raise ValueError("не удалось закодировать страницу коллажа")
+            media.append(encoded.tobytes())
+
+            # В одну медиагруппу Telegram помещается не больше 10 фото
+            if len(media) == 10:
+                send_collage_pages(user_id, media, pages_sent)
+                pages_sent += len(media)
+                media = []
+
+        if media:
+            send_collage_pages(user_id, media, pages_sent)
+            pages_sent += len(media)
     except Exception as e:
         print(f"Ошибка при отправке коллажа пользователю {user_id}: {e}")
         bot.reply_to(message, "Произошла ошибка при отправке коллажа. Попробуйте позже.")
-    finally:
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
+        return
+
+    if pages_sent == 0:
+        bot.reply_to(message, "Пока нет призов для создания коллажа, или произошла ошибка при его создании (возможно, в базе данных нет призов).")
+        return
+
+    print(f"Коллаж ({pages_sent} стр.) отправлен пользователю {user_id}.")
+
+
+def send_collage_pages(user_id, pages, pages_sent):
+    caption = "Ваш коллаж призов:" if pages_sent == 0 else None
+    if len(pages) == 1:
+        bot.send_photo(user_id, io.BytesIO(pages[0]), caption=caption)
+    else:
+        bot.send_media_group(user_id, [InputMediaPhoto(io.BytesIO(page), caption=caption if i == 0 else None) for i, page in enumerate(pages)])
 
 
 def polling_thread():
     print("Поллинг бота запущен...")
-    bot.polling(none_stop=True, interval=2, timeout=20)
+    dispatcher.poll(interval=2, timeout=20)
 
 
 if __name__ == '__main__':
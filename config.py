@@ -1,2 +1,15 @@
 API_TOKEN = 'YOUR_API_TOKEN'
 DATABASE = 'data.db'
+STORAGE = 'sqlite' # 'sqlite' или 'memory' (данные в памяти, теряются при перезапуске)
+DISPATCH_WORKERS = 4 # Потоки для команд (/start, /rating, /my_score)
+CLAIM_WORKERS = 16 # Потоки для нажатий 'Получить!'
+SENDER_WORKERS = 8 # Потоки рассылки новых призов, общие для всех розыгрышей
+BROADCAST_RATE = 25 # Максимум сообщений рассылки в секунду (Telegram допускает около 30)
+BACKUP_INTERVAL_HOURS = 24 # Как часто делать резервную копию базы в каталог backups/
+ARCHIVE_INTERVAL_HOURS = 1 # Как часто переносить победителей разобранных призов в базу истории (<база>_history.db)
+
+# Розыгрыши, которые бот ведет одновременно. Если CAMPAIGNS не задан, используется один розыгрыш 'main' с базой DATABASE и каталогом img/.
+# CAMPAIGNS = [
+#     {'name': 'main', 'database': DATABASE},
+#     {'name': 'cats', 'database': 'cats.db', 'img_dir': 'cats_img', 'prize_limit': 5, 'interval_minutes': 60, 'audience': [123456789]},
+# ]
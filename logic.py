@@ -5,6 +5,17 @@ import cv2
 import threading
 import numpy as np
 import math 
+import time
+import queue
+import random
+import heapq
+import itertools
+import io
+import re
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import Future
+from abc import ABC, abstractmethod
 
 try:
     from config import DATABASE
@@ -12,11 +23,98 @@ except ImportError:
     DATABASE = None
     print("Предупреждение: файл config.py не найден. Он требуется для работы бота.")
 
-class DatabaseManager:
-    def __init__(self, database):
+PRIZE_LIMIT = 3 # Максимальное количество победителей для одного приза
+
+# umask процесса (os.umask нельзя прочитать, не установив). Нужен _write_image, чтобы файлы получали обычные права.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+class Storage(ABC):
+    # Интерфейс хранилища бота. bot.py и create_collage работают только через эти методы,
+    # поэтому реализацию можно выбрать в config.py (см. create_storage).
+    # DatabaseManager хранит данные в SQLite, MemoryStorage - в памяти процесса.
+    # Лимит победителей одного приза хранится в атрибуте prize_limit.
+    # Реализация обязана определить все методы, иначе её экземпляр нельзя создать.
+    # Порядок результатов входит в интерфейс: get_all_prizes, get_all_prize_images и get_winners_img - по prize_id
+    # (порядок плиток коллажа), get_rating - по убыванию числа призов, при равенстве по user_id.
+
+    @abstractmethod
+    def create_tables(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_user(self, user_id, user_name):
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_users(self, users):
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_prize(self, data):
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_winner(self, user_id, prize_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_winners(self, prize_id, user_ids):
+        raise NotImplementedError
+
+    @abstractmethod
+    def mark_prize_used(self, prize_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_users(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_prize_img(self, prize_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_all_prize_images(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_all_prizes(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_winners_img(self, user_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_random_prize(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_total_prizes_count(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_user_won_prizes_count(self, user_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_winners_count(self, prize_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_rating(self):
+        raise NotImplementedError
+
+
+class DatabaseManager(Storage):
+    def __init__(self, database, prize_limit=PRIZE_LIMIT, history_database=None):
         if not database:
             raise ValueError("Путь к базе данных не указан при создании DatabaseManager.")
         self.database = database
+        self.prize_limit = prize_limit
+        self.history_database = history_database # База с архивом победителей разобранных призов (см. DatabaseMaintenance)
         self.lock = threading.RLock()
 
     def create_tables(self):
@@ -28,6 +126,9 @@ class DatabaseManager:
         conn = None
         try:
             conn = sqlite3.connect(self.database)
+            # WAL: читатели не блокируют запись, поэтому резервное копирование (DatabaseMaintenance) не мешает выдаче призов.
+            # Режим сохраняется в файле базы, PRAGMA выполняется вне транзакции.
+            conn.execute('PRAGMA journal_mode=WAL')
             with conn:
                 conn.execute('''
                 CREATE TABLE IF NOT EXISTS users (
@@ -55,6 +156,14 @@ class DatabaseManager:
                     FOREIGN KEY(prize_id) REFERENCES prizes(prize_id)
                 )
             ''')
+
+                # Количество призов пользователя, чьи строки winners перенесены в архив
+                conn.execute('''
+                CREATE TABLE IF NOT EXISTS user_archived_counts (
+                    user_id INTEGER PRIMARY KEY,
+                    prize_count INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
         except sqlite3.Error as e:
             print(f"Ошибка при создании таблиц: {e}")
 
@@ -73,6 +182,27 @@ class DatabaseManager:
                     return False
 
 
+    def add_users(self, users):
+        # Регистрирует пачку пользователей [(user_id, user_name), ...] одной транзакцией.
+        # Возвращает множество user_id, которые были добавлены впервые.
+        if not users:
+            return set()
+
+        placeholders = ', '.join(['(?, ?)'] * len(users))
+        params = [value for user in users for value in user]
+
+        with self.lock:
+            conn = sqlite3.connect(self.database)
+            with conn:
+                cur = conn.cursor()
+                cur.execute(f'''
+                    INSERT INTO users (user_id, user_name) VALUES {placeholders}
+                    ON CONFLICT(user_id) DO NOTHING
+                    RETURNING user_id
+                ''', params)
+                return {x[0] for x in cur.fetchall()}
+
+
     def add_prize(self, data):
         with self.lock:
             conn = sqlite3.connect(self.database)
@@ -98,7 +228,6 @@ class DatabaseManager:
         # Возможные причины -2: Повреждение файла базы данных. Ошибки с разрешениями на запись в файл базы данных. Любая другая внутренняя ошибка Python или SQLite, которая не связана напрямую с логикой выигрыша приза (1,0,-1).
         
         win_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        PRIZE_LIMIT = 3 # Максимальное количество победителей для одного приза
 
         with self.lock:
             conn = sqlite3.connect(self.database)
@@ -120,12 +249,17 @@ class DatabaseManager:
                     prize_id_check, prize_globally_used_status = prize_info 
 
                     if prize_globally_used_status == 1:
+                        # Победители разобранного приза могли уже уйти в архив (DatabaseMaintenance)
+                        if self._attach_history(cur):
+                            cur.execute("SELECT 1 FROM history.winners_history WHERE user_id = ? AND prize_id = ?", (user_id, prize_id))
+                            if cur.fetchone():
+                                return 0
                         return -1 
 
                     cur.execute("SELECT COUNT(DISTINCT user_id) FROM winners WHERE prize_id = ?", (prize_id,))
                     current_winners_count_for_prize = cur.fetchone()[0]
 
-                    if current_winners_count_for_prize >= PRIZE_LIMIT:
+                    if current_winners_count_for_prize >= self.prize_limit:
                         if prize_globally_used_status == 0:
                             cur.execute('''UPDATE prizes SET used = 1 WHERE prize_id = ?''', (prize_id,))
                             conn.commit() 
@@ -138,7 +272,7 @@ class DatabaseManager:
                     
                     new_total_winners_for_prize = current_winners_count_for_prize + 1
 
-                    if new_total_winners_for_prize >= PRIZE_LIMIT:
+                    if new_total_winners_for_prize >= self.prize_limit:
                         if prize_globally_used_status == 0:
                              cur.execute('''UPDATE prizes SET used = 1 WHERE prize_id = ?''', (prize_id,))
 
@@ -154,6 +288,61 @@ class DatabaseManager:
                     return -2 # Возвращается, если во время выполнения операции add_winner возникла непредвиденная ошибка (Exception), которая не была явно обработана (например, не sqlite3.IntegrityError).
 
 
+    def add_winners(self, prize_id, user_ids):
+        # Разбирает пачку нажатий по одному призу в одной транзакции.
+        # user_ids - в порядке нажатий; возвращает список статусов add_winner (1, 0, -1, -2) в том же порядке.
+        win_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        with self.lock:
+            conn = sqlite3.connect(self.database)
+            with conn:
+                cur = conn.cursor()
+
+                try:
+                    cur.execute("SELECT used FROM prizes WHERE prize_id = ?", (prize_id,))
+                    prize_info = cur.fetchone()
+
+                    if prize_info is None:
+                        return [-1] * len(user_ids)
+
+                    prize_globally_used_status = prize_info[0]
+
+                    cur.execute("SELECT DISTINCT user_id FROM winners WHERE prize_id = ?", (prize_id,))
+                    prize_winners = {x[0] for x in cur.fetchall()}
+                    if prize_globally_used_status == 1 and self._attach_history(cur):
+                        cur.execute("SELECT user_id FROM history.winners_history WHERE prize_id = ?", (prize_id,))
+                        prize_winners.update(x[0] for x in cur.fetchall())
+
+                    statuses = []
+                    new_winners = []
+                    for user_id in user_ids:
+                        if user_id in prize_winners:
+                            statuses.append(0)
+                        elif prize_globally_used_status == 1 or len(prize_winners) >= self.prize_limit:
+                            statuses.append(-1)
+                        else:
+                            prize_winners.add(user_id)
+                            new_winners.append((user_id, prize_id, win_time))
+                            statuses.append(1)
+
+                    if new_winners:
+                        cur.executemany('''
+                            INSERT INTO winners (user_id, prize_id, win_time)
+                            VALUES (?, ?, ?)
+                        ''', new_winners)
+
+                    if prize_globally_used_status == 0 and len(prize_winners) >= self.prize_limit:
+                        cur.execute('''UPDATE prizes SET used = 1 WHERE prize_id = ?''', (prize_id,))
+
+                    conn.commit()
+                    return statuses
+
+                except Exception as e:
+                    conn.rollback()
+                    print(f"add_winners: Неожиданная ошибка для приза {prize_id} ({len(user_ids)} нажатий): {e}")
+                    return [-2] * len(user_ids)
+
+
     def mark_prize_used(self, prize_id):
         with self.lock:
             conn = sqlite3.connect(self.database)
@@ -189,19 +378,39 @@ class DatabaseManager:
             conn = sqlite3.connect(self.database)
             with conn:
                 cur = conn.cursor()
-                cur.execute('SELECT image FROM prizes')
+                cur.execute('SELECT image FROM prizes ORDER BY prize_id')
                 return [x[0] for x in cur.fetchall()]
 
+    def get_all_prizes(self):
+        with self.lock:
+            conn = sqlite3.connect(self.database)
+            with conn:
+                cur = conn.cursor()
+                cur.execute('SELECT prize_id, image FROM prizes ORDER BY prize_id')
+                return cur.fetchall()
+
     def get_winners_img(self, user_id):
         with self.lock:
             conn = sqlite3.connect(self.database)
             with conn:
                 cur = conn.cursor()
-                cur.execute('''
-                    SELECT p.image FROM winners w
+                query = '''
+                    SELECT p.prize_id, p.image FROM winners w
                     INNER JOIN prizes p ON w.prize_id = p.prize_id
                     WHERE w.user_id = ?
-                ''', (user_id,))
+                '''
+                params = (user_id,)
+
+                if self._attach_history(cur):
+                    query += '''
+                    UNION ALL
+                    SELECT p.prize_id, p.image FROM history.winners_history h
+                    INNER JOIN prizes p ON h.prize_id = p.prize_id
+                    WHERE h.user_id = ?
+                    '''
+                    params = (user_id, user_id)
+
+                cur.execute(f'SELECT image FROM ({query}) ORDER BY prize_id', params)
                 return cur.fetchall()
 
 
@@ -228,7 +437,10 @@ class DatabaseManager:
             conn = sqlite3.connect(self.database)
             with conn:
                 cur = conn.cursor()
-                cur.execute('SELECT COUNT(DISTINCT prize_id) FROM winners WHERE user_id = ?', (user_id,))
+                cur.execute('''
+                    SELECT (SELECT COUNT(DISTINCT prize_id) FROM winners WHERE user_id = ?)
+                         + COALESCE((SELECT prize_count FROM user_archived_counts WHERE user_id = ?), 0)
+                ''', (user_id, user_id))
                 count = cur.fetchone()[0]
                 return count
 
@@ -239,6 +451,9 @@ class DatabaseManager:
                 cur = conn.cursor()
                 cur.execute("SELECT COUNT(DISTINCT user_id) FROM winners WHERE prize_id = ?", (prize_id,))
                 count = cur.fetchone()[0]
+                if self._attach_history(cur):
+                    cur.execute("SELECT COUNT(*) FROM history.winners_history WHERE prize_id = ?", (prize_id,))
+                    count += cur.fetchone()[0]
                 return count
 
     def get_rating(self):
@@ -247,149 +462,970 @@ class DatabaseManager:
             with conn:
                 cur = conn.cursor()
                 cur.execute('''
-                    SELECT u.user_name, COUNT(DISTINCT w.prize_id) AS prize_count
+                    SELECT u.user_name, COALESCE(w.prize_count, 0) + COALESCE(a.prize_count, 0) AS prize_count
                     FROM users AS u
-                    JOIN winners AS w ON u.user_id = w.user_id
-                    GROUP BY u.user_id, u.user_name
-                    ORDER BY prize_count DESC
+                    LEFT JOIN (
+                        SELECT user_id, COUNT(DISTINCT prize_id) AS prize_count
+                        FROM winners
+                        GROUP BY user_id
+                    ) AS w ON u.user_id = w.user_id
+                    LEFT JOIN user_archived_counts AS a ON u.user_id = a.user_id
+                    WHERE w.prize_count IS NOT NULL OR a.prize_count > 0
+                    ORDER BY prize_count DESC, u.user_id
                     LIMIT 10
                 ''')
                 results = cur.fetchall()
                 return results
 
+    def _attach_history(self, cur):
+        # Подключает архив победителей как схему history, если он уже создан. ATTACH нельзя выполнить
+        # внутри транзакции, поэтому вызывать до первой записи в соединении.
+        if not self.history_database or not os.path.exists(self.history_database):
+            return False
+        cur.execute('ATTACH DATABASE ? AS history', (self.history_database,))
+        return True
+
+
+class MemoryStorage(Storage):
+    # Хранилище в памяти процесса с теми же ответами, что и у DatabaseManager. Данные теряются при перезапуске,
+    # поэтому подходит для тестов, бенчмарков и одноразовых розыгрышей.
+
+    def __init__(self, prize_limit=PRIZE_LIMIT):
+        self.prize_limit = prize_limit
+        self.lock = threading.RLock()
+        self.users = {}               # user_id -> user_name
+        self.prizes = {}              # prize_id -> image
+        self.unused_prizes = []       # prize_id призов с used = 0
+        self.unused_index = {}        # prize_id -> позиция в unused_prizes
+        self.prize_winners = {}       # prize_id -> {user_id: win_time}
+        self.user_wins = {}           # user_id -> {prize_id: win_time}
+        self.next_prize_id = 1
+
+    def create_tables(self):
+        pass
+
+    def add_user(self, user_id, user_name):
+        with self.lock:
+            if user_id in self.users:
+                return False
+            self.users[user_id] = user_name
+            return True
+
+    def add_users(self, users):
+        with self.lock:
+            new_user_ids = set()
+            for user_id, user_name in users:
+                if user_id not in self.users:
+                    self.users[user_id] = user_name
+                    new_user_ids.add(user_id)
+            return new_user_ids
+
+    def add_prize(self, data):
+        with self.lock:
+            if self.prizes:
+                return
+            for (image,) in data:
+                prize_id = self.next_prize_id
+                self.next_prize_id += 1
+                self.prizes[prize_id] = image
+                self.prize_winners[prize_id] = {}
+                self._set_unused(prize_id)
+            print(f"Попытка добавить {len(data)} призов. Добавлено новых: {len(data)}")
+
+    def _set_unused(self, prize_id):
+        self.unused_index[prize_id] = len(self.unused_prizes)
+        self.unused_prizes.append(prize_id)
+
+    def _set_used(self, prize_id):
+        # Удаление из списка за O(1): на место удаляемого приза переносится последний.
+        index = self.unused_index.pop(prize_id, None)
+        if index is None:
+            return
+        last = self.unused_prizes.pop()
+        if last != prize_id:
+            self.unused_prizes[index] = last
+            self.unused_index[last] = index
+
+    def add_winner(self, user_id, prize_id):
+        # Те же статусы, что и у DatabaseManager.add_winner.
+        win_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        with self.lock:
+            try:
+                winners = self.prize_winners.get(prize_id)
+                if winners is None:
+                    return -1
+
+                if user_id in winners:
+                    return 0
+
+                if prize_id not in self.unused_index:
+                    return -1
+
+                if len(winners) >= self.prize_limit:
+                    self._set_used(prize_id)
+                    return -1
+
+                winners[user_id] = win_time
+                self.user_wins.setdefault(user_id, {})[prize_id] = win_time
+
+                if len(winners) >= self.prize_limit:
+                    self._set_used(prize_id)
+                return 1
+
+            except Exception as e:
+                print(f"add_winner: Неожиданная ошибка для пользователя {user_id}, приза {prize_id}: {e}")
+                return -2
+
+    def add_winners(self, prize_id, user_ids):
+        with self.lock:
+            return [self.add_winner(user_id, prize_id) for user_id in user_ids]
+
+    def mark_prize_used(self, prize_id):
+        with self.lock:
+            self._set_used(prize_id)
+
+    def get_users(self):
+        with self.lock:
+            return list(self.users)
+
+    def get_prize_img(self, prize_id):
+        with self.lock:
+            return self.prizes.get(prize_id)
+
+    def get_all_prize_images(self):
+        with self.lock:
+            return list(self.prizes.values())
+
+    def get_all_prizes(self):
+        with self.lock:
+            return list(self.prizes.items())
+
+    def get_winners_img(self, user_id):
+        with self.lock:
+            return [(self.prizes[prize_id],) for prize_id in sorted(self.user_wins.get(user_id, {}))]
+
+    def get_random_prize(self):
+        with self.lock:
+            if not self.unused_prizes:
+                return None
+            prize_id = random.choice(self.unused_prizes)
+            return (prize_id, self.prizes[prize_id])
+
+    def get_total_prizes_count(self):
+        with self.lock:
+            return len(self.prizes)
+
+    def get_user_won_prizes_count(self, user_id):
+        with self.lock:
+            return len(self.user_wins.get(user_id, {}))
+
+    def get_winners_count(self, prize_id):
+        with self.lock:
+            return len(self.prize_winners.get(prize_id, {}))
+
+    def get_rating(self):
+        with self.lock:
+            counts = [(user_id, len(wins)) for user_id, wins in self.user_wins.items() if wins and user_id in self.users]
+            # При равенстве призов выше пользователь с меньшим user_id, как в ORDER BY у DatabaseManager
+            top = heapq.nlargest(10, counts, key=lambda x: (x[1], -x[0]))
+            return [(self.users[user_id], prize_count) for user_id, prize_count in top]
+
+
+def create_storage(kind, database=None, prize_limit=PRIZE_LIMIT, history_database=None):
+    # kind: 'sqlite' (по умолчанию) или 'memory'.
+    if kind == 'sqlite':
+        return DatabaseManager(database, prize_limit, history_database)
+    if kind == 'memory':
+        return MemoryStorage(prize_limit)
+    raise ValueError(f"Неизвестный тип хранилища: {kind}. Допустимые значения: 'sqlite', 'memory'.")
+
+
+class DatabaseMaintenance:
+    # Обслуживание базы DatabaseManager без остановки выдачи призов:
+    # - онлайн-резервные копии через sqlite3 backup API со снимка базы в режиме WAL;
+    # - перенос строк winners разобранных призов в отдельную компактную базу истории, чтобы таблица winners оставалась маленькой.
+
+    def __init__(self, manager, backup_dir='backups', keep_backups=7, step_pause=0.01, archive_chunk=50):
+        self.manager = manager
+        self.backup_dir = backup_dir
+        self.keep_backups = keep_backups
+        self.step_pause = step_pause
+        self.archive_chunk = archive_chunk
+        self.lock = threading.Lock() # Не дает запустить две операции обслуживания одновременно
+
+    def backup(self):
+        # Копирует базу и, если она уже создана, history_database: копия без архива потеряла бы победителей
+        # разобранных призов. Возвращает путь к копии основной базы или None.
+        if not self.lock.acquire(blocking=False):
+            print("Обслуживание БД: предыдущая операция еще не завершена, резервное копирование пропущено.")
+            return None
+
+        try:
+            backup_path = self._backup_file(self.manager.database)
+            history = self.manager.history_database
+            if history and os.path.exists(history):
+                self._backup_file(history)
+            return backup_path
+        finally:
+            self.lock.release()
+
+    def _backup_file(self, database):
+        # Копирует базу за один шаг backup API. В режиме WAL шаг читает согласованный снимок базы и не блокирует
+        # запись, поэтому manager.lock не берется и нажатия "Получить!" во время копирования не ждут. Пошаговое
+        # копирование здесь не подходит: SQLite начинает его заново после каждой записи из другого соединения.
+        try:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            base_name = os.path.splitext(os.path.basename(database))[0]
+            backup_path = os.path.join(self.backup_dir, f"{base_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db")
+            tmp_path = f'{backup_path}.tmp'
+
+            src = sqlite3.connect(database)
+            dst = sqlite3.connect(tmp_path)
+            try:
+                src.backup(dst)
+                # Копия получает режим WAL из заголовка базы; переводим ее в обычный журнал, чтобы копия была одним файлом
+                dst.execute('PRAGMA journal_mode=DELETE')
+            finally:
+                dst.close()
+                src.close()
+
+            os.replace(tmp_path, backup_path)
+            self._prune_backups(base_name)
+            print(f"Обслуживание БД: резервная копия создана: {backup_path}")
+            return backup_path
+
+        except Exception as e:
+            print(f"Обслуживание БД: ошибка при резервном копировании {database}: {e}")
+            return None
+
+    def archive_finished_prizes(self):
+        # Переносит победителей разобранных призов (used = 1) в history_database и добавляет их призы в user_archived_counts,
+        # поэтому рейтинг, счетчики и коллажи пользователей не меняются. Каждая порция из archive_chunk призов -
+        # отдельная короткая транзакция, между порциями нажатия "Получить!" проходят без ожидания.
+        # Возвращает количество перенесенных строк.
+        history = self.manager.history_database
+        if not history:
+            print("Обслуживание БД: history_database не задана, архивирование пропущено.")
+            return 0
+
+        if not self.lock.acquire(blocking=False):
+            print("Обслуживание БД: предыдущая операция еще не завершена, архивирование пропущено.")
+            return 0
+
+        archived = 0
+        try:
+            conn = sqlite3.connect(history)
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                conn.execute('''
+                CREATE TABLE IF NOT EXISTS winners_history (
+                    user_id INTEGER,
+                    prize_id INTEGER,
+                    win_time TEXT,
+                    PRIMARY KEY(prize_id, user_id)
+                ) WITHOUT ROWID
+            ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS winners_history_user ON winners_history(user_id)')
+            conn.close()
+
+            while True:
+                with self.manager.lock:
+                    conn = sqlite3.connect(self.manager.database)
+                    try:
+                        conn.execute('ATTACH DATABASE ? AS history', (history,))
+                        with conn:
+                            cur = conn.cursor()
+                            cur.execute('''
+                                SELECT DISTINCT w.prize_id FROM winners w
+                                INNER JOIN prizes p ON w.prize_id = p.prize_id
+                                WHERE p.used = 1
+                                LIMIT ?
+                            ''', (self.archive_chunk,))
+                            prize_ids = [x[0] for x in cur.fetchall()]
+                            if not prize_ids:
+                                break
+
+                            placeholders = ', '.join('?' * len(prize_ids))
+                            # OR IGNORE: после восстановления основной базы из копии в winners могут снова оказаться
+                            # строки, которые уже есть в архиве. В user_archived_counts восстановленной базы их еще нет,
+                            # поэтому счетчики ниже по-прежнему увеличиваются.
+                            cur.execute(f'''
+                                INSERT OR IGNORE INTO history.winners_history (user_id, prize_id, win_time)
+                                SELECT user_id, prize_id, win_time FROM winners WHERE prize_id IN ({placeholders})
+                            ''', prize_ids)
+                            cur.execute(f'''
+                                INSERT INTO user_archived_counts (user_id, prize_count)
+                                SELECT user_id, COUNT(DISTINCT prize_id) FROM winners
+                                WHERE prize_id IN ({placeholders})
+                                GROUP BY user_id
+                                ON CONFLICT(user_id) DO UPDATE SET prize_count = prize_count + excluded.prize_count
+                            ''', prize_ids)
+                            cur.execute(f'DELETE FROM winners WHERE prize_id IN ({placeholders})', prize_ids)
+                            archived += cur.rowcount
+                    finally:
+                        conn.close()
+
+                time.sleep(self.step_pause)
+
+            if archived:
+                print(f"Обслуживание БД: в архив {history} перенесено строк winners: {archived}")
+            return archived
+
+        except Exception as e:
+            print(f"Обслуживание БД: ошибка при архивировании победителей в {history}: {e}")
+            return archived
+        finally:
+            self.lock.release()
+
+    def _prune_backups(self, base_name):
+        # Только копии этой базы: у data.db префикс "data_" совпадает и с копиями data_x.db и data_history.db.
+        pattern = re.compile(rf'{re.escape(base_name)}_\d{{8}}_\d{{6}}\.db')
+        backups = sorted(f for f in os.listdir(self.backup_dir) if pattern.fullmatch(f))
+        for old in backups[:-self.keep_backups]:
+            try:
+                os.remove(os.path.join(self.backup_dir, old))
+            except OSError as e:
+                print(f"Обслуживание БД: не удалось удалить старую резервную копию {old}: {e}")
+
+
+class ClaimGuard:
+    # Защита перед callback_query: повторные и запоздалые нажатия "Получить!" обрабатываются из памяти, без обращения к БД.
+    # begin() возвращает None, если нажатие нужно передать в add_winner, иначе статус в терминах add_winner:
+    # 0: пользователь уже получил этот приз
+    # -1: приз уже разобран
+    # -3: нажатие проигнорировано (такой же запрос уже обрабатывается или пользователь нажимает слишком часто)
+    # Ответ -1 из памяти дается только паре (пользователь, приз), для которой БД уже вернула -1: после перезапуска
+    # claimed пуст, и победитель, снова нажавший на разобранный приз, должен получить от БД 0, а не -1.
+
+    def __init__(self, debounce_seconds=1.0):
+        self.debounce_seconds = debounce_seconds
+        self.lock = threading.Lock()
+        self.rejected = set() # (user_id, prize_id), для которых БД уже ответила -1
+        self.claimed = set()
+        self.in_flight = set()
+        self.last_click = {}
+
+    def begin(self, user_id, prize_id):
+        key = (user_id, prize_id)
+        now = time.monotonic()
+        with self.lock:
+            if key in self.claimed:
+                return 0
+            if key in self.rejected:
+                return -1
+            if key in self.in_flight:
+                return -3
+            last = self.last_click.get(user_id)
+            if last is not None and now - last < self.debounce_seconds:
+                return -3
+            self.last_click[user_id] = now
+            self.in_flight.add(key)
+
+            if len(self.last_click) > 10000:
+                self.last_click = {uid: t for uid, t in self.last_click.items() if now - t < self.debounce_seconds}
+            return None
+
+    def finish(self, user_id, prize_id, status):
+        # Запоминает результат add_winner, чтобы следующие нажатия по этому призу не доходили до БД.
+        key = (user_id, prize_id)
+        with self.lock:
+            self.in_flight.discard(key)
+            if status in (1, 0):
+                self.claimed.add(key)
+            elif status == -1:
+                self.rejected.add(key)
+
+
+class RegistrationBatcher:
+    # Групповая запись регистраций для /start: вызовы submit и add_user копятся в очереди и раз в interval секунд
+    # записываются одним INSERT ... ON CONFLICT DO NOTHING RETURNING вместо отдельной транзакции на каждого пользователя.
+
+    def __init__(self, manager, interval=0.005, max_batch=400):
+        self.manager = manager
+        self.interval = interval
+        self.max_batch = max_batch # 2 параметра на пользователя, держимся ниже старого лимита SQLite в 999 переменных
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, user_id, user_name):
+        # Не блокирует: возвращает Future, который после записи пачки получит True для нового пользователя
+        # и False для уже зарегистрированного. Так число пользователей в пачке не ограничено числом потоков обработчиков.
+        future = Future()
+        self.pending.put((user_id, user_name, future))
+        return future
+
+    def add_user(self, user_id, user_name):
+        # Блокирующий вариант submit для кода вне обработчиков бота.
+        return self.submit(user_id, user_name).result()
+
+    def _run(self):
+        while True:
+            batch = [self.pending.get()]
+            time.sleep(self.interval)
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch):
+        users = {}
+        for user_id, user_name, _ in batch:
+            users.setdefault(user_id, user_name)
+
+        try:
+            new_user_ids = self.manager.add_users(list(users.items()))
+        except Exception as e:
+            print(f"RegistrationBatcher: Ошибка при записи пачки из {len(batch)} регистраций: {e}")
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        # Если пользователь нажал /start несколько раз в одной пачке, новым считается только первый вызов.
+        for user_id, _, future in batch:
+            if user_id in new_user_ids:
+                new_user_ids.discard(user_id)
+                future.set_result(True)
+            else:
+                future.set_result(False)
+
+
+class ClaimBatcher:
+    # Собирает нажатия "Получить!" по каждому призу в течение window секунд и разбирает их одной транзакцией add_winners.
+    # Нажатия регистрируются через submit в потоке поллинга (UpdateDispatcher.dispatch -> on_callback) по порядку update_id,
+    # до передачи обновления в рабочие потоки. Поэтому номер нажатия и попадание в пачку не зависят от того, когда рабочий
+    # поток доберется до обработчика (answer_callback_query и другие запросы к Telegram идут уже после регистрации),
+    # и приз получают действительно первые нажавшие.
+
+    def __init__(self, manager, window=0.05):
+        self.manager = manager
+        self.window = window
+        self.lock = threading.Lock()
+        self.pending = {} # prize_id -> [(seq, user_id, future), ...]
+        self.sequence = itertools.count()
+
+    def submit(self, user_id, prize_id, seq=None):
+        # Не блокирует: ставит нажатие в пачку приза и возвращает Future со статусом в терминах add_winner.
+        if seq is None:
+            seq = next(self.sequence)
+        future = Future()
+
+        with self.lock:
+            batch = self.pending.get(prize_id)
+            if batch is None:
+                batch = self.pending[prize_id] = []
+                timer = threading.Timer(self.window, self._flush, args=(prize_id,))
+                timer.daemon = True
+                timer.start()
+            batch.append((seq, user_id, future))
 
-def hide_img(img_name):
-    os.makedirs('hidden_img', exist_ok=True)
-    image_path = f'img/{img_name}'
+        return future
+
+    def claim(self, user_id, prize_id, seq=None):
+        # Блокирующий вариант submit.
+        return self.submit(user_id, prize_id, seq).result()
+
+    def _flush(self, prize_id):
+        with self.lock:
+            batch = self.pending.pop(prize_id, [])
+
+        batch.sort(key=lambda x: x[0])
+        try:
+            statuses = self.manager.add_winners(prize_id, [user_id for _, user_id, _ in batch])
+        except Exception as e:
+            print(f"ClaimBatcher: Ошибка при разборе {len(batch)} нажатий для приза {prize_id}: {e}")
+            statuses = [-2] * len(batch)
+
+        for (_, _, future), status in zip(batch, statuses):
+            future.set_result(status)
+
+
+class UpdateDispatcher:
+    # Распределяет обновления Telegram по рабочим потокам по хешу chat_id: обновления одного чата обрабатываются
+    # по порядку, разные чаты - параллельно. Нажатия на кнопки (callback_query) идут в одну общую очередь,
+    # которую разбирают claim_workers потоков, поэтому выдача призов не ждет сборки коллажей и рейтинга.
+    # Очередь нажатий не шардируется: обработчик ждет разбора пачки в ClaimBatcher, и при шардировании
+    # нажатия, попавшие за занятый поток, опаздывали к своей пачке и проигрывали более поздним.
+    # bot должен быть создан с threaded=False: обработчики выполняются прямо в рабочих потоках диспетчера.
+
+    def __init__(self, bot, workers=4, claim_workers=16, on_callback=None):
+        self.bot = bot
+        self.on_callback = on_callback
+        self.lock = threading.Lock()
+        self.lanes = {
+            'updates': [queue.Queue() for _ in range(workers)],
+            'claims': [queue.Queue()],
+        }
+        threads_per_lane = {'updates': 1, 'claims': claim_workers}
+        self.peak_depth = {name: 0 for name in self.lanes}
+        self.processed = {name: 0 for name in self.lanes}
+
+        for name, queues in self.lanes.items():
+            for lane in queues:
+                for _ in range(threads_per_lane[name]):
+                    thread = threading.Thread(target=self._work, args=(name, lane), daemon=True)
+                    thread.start()
+
+    def dispatch(self, updates):
+        # Вызывается из потока поллинга, поэтому on_callback видит нажатия в порядке update_id.
+        for update in updates:
+            if update.callback_query is not None:
+                if self.on_callback is not None:
+                    try:
+                        self.on_callback(update.callback_query)
+                    except Exception as e:
+                        print(f"UpdateDispatcher: Ошибка on_callback для обновления {update.update_id}: {e}")
+                name = 'claims'
+            else:
+                name = 'updates'
+
+            queues = self.lanes[name]
+            lane = queues[hash(self._chat_id(update)) % len(queues)]
+            lane.put(update)
+
+            depth = lane.qsize()
+            with self.lock:
+                if depth > self.peak_depth[name]:
+                    self.peak_depth[name] = depth
+
+    def poll(self, interval=2, timeout=20):
+        # Замена bot.polling: получает обновления long polling'ом и раздает их рабочим потокам.
+        offset = None
+        while True:
+            try:
+                updates = self.bot.get_updates(offset=offset, timeout=timeout + 10, long_polling_timeout=timeout)
+            except Exception as e:
+                print(f"UpdateDispatcher: Ошибка при получении обновлений: {e}")
+                time.sleep(interval)
+                continue
+
+            if updates:
+                # offset сдвигается до раздачи: обновление, на котором упала раздача, не будет получено повторно.
+                offset = updates[-1].update_id + 1
+                try:
+                    self.dispatch(updates)
+                except Exception as e:
+                    print(f"UpdateDispatcher: Ошибка при раздаче обновлений: {e}")
+
+    def queue_depths(self):
+        # Текущая глубина каждой очереди, максимальная глубина с момента запуска и число обработанных обновлений.
+        with self.lock:
+            return {
+                name: {
+                    'depths': [lane.qsize() for lane in queues],
+                    'peak': self.peak_depth[name],
+                    'processed': self.processed[name],
+                }
+                for name, queues in self.lanes.items()
+            }
+
+    def _work(self, name, lane):
+        while True:
+            update = lane.get()
+            try:
+                self.bot.process_new_updates([update])
+            except Exception as e:
+                print(f"UpdateDispatcher: Ошибка при обработке обновления {update.update_id}: {e}")
+            with self.lock:
+                self.processed[name] += 1
+
+    @staticmethod
+    def _chat_id(update):
+        if update.callback_query is not None:
+            call = update.callback_query
+            return call.message.chat.id if call.message else call.from_user.id
+        for name in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+            message = getattr(update, name, None)
+            if message is not None:
+                return message.chat.id
+        return update.update_id
+
+
+class RateLimiter:
+    # Ограничитель скорости отправки (token bucket), общий для всех розыгрышей процесса.
+    # Telegram допускает около 30 сообщений в секунду от одного бота, поэтому по умолчанию 25.
+
+    def __init__(self, rate=25, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # Блокирует вызывающий поток, пока отправка не станет разрешена.
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ImageCache:
+    # LRU-кэш байтов изображений призов, ограниченный суммарным размером max_bytes.
+    # Ключ - путь и время изменения файла, поэтому перезаписанный файл (например, заново созданный hidden_img) читается с диска повторно.
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict() # path -> (mtime, data)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path):
+        # Возвращает байты файла или None, если файла нет.
+        return self._get(path, count=True)
+
+    def open(self, path):
+        # То же, что open(path, 'rb'), но из памяти. Возвращает None, если файла нет.
+        data = self.get(path)
+        if data is None:
+            return None
+        return io.BytesIO(data)
+
+    def prewarm(self, paths):
+        # Заранее загружает файлы в кэш (например, оригинал и скрытую версию текущего приза). Не влияет на счетчики.
+        for path in paths:
+            self._get(path, count=False)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+            }
+
+    def _get(self, path, count):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] == mtime:
+                self.entries.move_to_end(path)
+                if count:
+                    self.hits += 1
+                return entry[1]
+            if count:
+                self.misses += 1
+
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        with self.lock:
+            old = self.entries.pop(path, None)
+            if old is not None:
+                self.size -= len(old[1])
+            if len(data) <= self.max_bytes:
+                self.entries[path] = (mtime, data)
+                self.size += len(data)
+                while self.size > self.max_bytes:
+                    _, (_, evicted) = self.entries.popitem(last=False)
+                    self.size -= len(evicted)
+        return data
+
+
+IMG_DIR = 'img'                   # Оригиналы призов
+HIDDEN_IMG_DIR = 'hidden_img'     # Пикселизированные превью для рассылки
+OPTIMIZED_IMG_DIR = 'optimized_img' # Оригиналы, подготовленные для отправки победителям
+
+MAX_IMAGE_SIDE = 1280     # Telegram все равно сжимает фото до 1280 пикселей по большей стороне
+JPEG_QUALITY = 85
+HIDDEN_IMAGE_SIDE = 480   # Мозаике 30x30 высокое разрешение не нужно
+HIDDEN_GRID_SIZE = (30, 30)
+
+
+def get_prize_img_path(img_name, img_dir=IMG_DIR, optimized_dir=OPTIMIZED_IMG_DIR):
+    # Путь к версии приза для отправки: подготовленная, если она уже есть, иначе оригинал.
+    optimized_path = os.path.join(optimized_dir, f'{img_name}.jpg')
+    if os.path.exists(optimized_path):
+        return optimized_path
+    return os.path.join(img_dir, img_name)
+
+
+def get_hidden_img_path(img_name, hidden_dir=HIDDEN_IMG_DIR):
+    return os.path.join(hidden_dir, f'{img_name}.png')
+
+
+def _is_fresh(variant_path, source_path):
+    return os.path.exists(variant_path) and os.path.getmtime(variant_path) >= os.path.getmtime(source_path)
+
+
+def _write_image(path, image, params):
+    # Запись через временный файл, чтобы параллельная отправка никогда не прочитала недописанное изображение.
+    # Имя временного файла уникально (mkstemp), поэтому одновременная подготовка одной картинки из разных потоков
+    # не пишет в общий файл; расширение сохраняется, по нему cv2.imwrite выбирает формат.
+    ext = os.path.splitext(path)[1]
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix=ext)
+    os.close(fd)
+    try:
+        if not cv2.imwrite(tmp_path, image, params):
+            raise ValueError(f"cv2.imwrite не смог записать {tmp_path}")
+        # mkstemp создает файл с правами 0600; возвращаем права, которые дал бы обычный cv2.imwrite с учетом umask
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _scale_to_fit(shape, max_side):
+    height, width = shape[:2]
+    scale = min(1.0, max_side / max(height, width))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def prepare_prize_images(img_name, img_dir=IMG_DIR, hidden_dir=HIDDEN_IMG_DIR, optimized_dir=OPTIMIZED_IMG_DIR):
+    # Готовит версии приза для Telegram: оригинал с ограниченным размером в JPEG и маленькое пикселизированное превью в PNG
+    # (однотонные блоки мозаики PNG сжимает лучше JPEG и без артефактов). Версии, которые новее оригинала, не пересоздаются.
+    # Возвращает True, если обе версии готовы.
+    image_path = os.path.join(img_dir, img_name)
 
     if not os.path.exists(image_path):
-        print(f"Ошибка [hide_img]: Исходный файл изображения не найден: {image_path}")
-        return
+        print(f"Ошибка [prepare_prize_images]: Исходный файл изображения не найден: {image_path}")
+        return False
+
+    optimized_path = os.path.join(optimized_dir, f'{img_name}.jpg')
+    hidden_path = get_hidden_img_path(img_name, hidden_dir)
+    if _is_fresh(optimized_path, image_path) and _is_fresh(hidden_path, image_path):
+        return True
 
     image = cv2.imread(image_path)
 
     if image is None:
-        print(f"Ошибка [hide_img]: Не удалось прочитать изображение {image_path}.")
-        return
+        print(f"Ошибка [prepare_prize_images]: Не удалось прочитать изображение {image_path}.")
+        return False
 
     if image.shape[0] == 0 or image.shape[1] == 0:
-        print(f"Ошибка [hide_img]: Изображение {image_path} имеет нулевые размеры.")
-        return
+        print(f"Ошибка [prepare_prize_images]: Изображение {image_path} имеет нулевые размеры.")
+        return False
 
     try:
-        small_img = cv2.resize(image, (30, 30), interpolation=cv2.INTER_NEAREST)
-        pixelated_image = cv2.resize(small_img, (image.shape[1], image.shape[0]), interpolation=cv2.INTER_NEAREST)
-        output_path = f'hidden_img/{img_name}'
-        cv2.imwrite(output_path, pixelated_image)
+        os.makedirs(optimized_dir, exist_ok=True)
+        os.makedirs(hidden_dir, exist_ok=True)
+
+        if not _is_fresh(optimized_path, image_path):
+            optimized = image
+            if max(image.shape[:2]) > MAX_IMAGE_SIDE:
+                optimized = cv2.resize(image, _scale_to_fit(image.shape, MAX_IMAGE_SIDE), interpolation=cv2.INTER_AREA)
+            _write_image(optimized_path, optimized, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY, cv2.IMWRITE_JPEG_OPTIMIZE, 1])
+
+        if not _is_fresh(hidden_path, image_path):
+            small_img = cv2.resize(image, HIDDEN_GRID_SIZE, interpolation=cv2.INTER_NEAREST)
+            pixelated_image = cv2.resize(small_img, _scale_to_fit(image.shape, HIDDEN_IMAGE_SIDE), interpolation=cv2.INTER_NEAREST)
+            _write_image(hidden_path, pixelated_image, [cv2.IMWRITE_PNG_COMPRESSION, 9])
+        return True
     except Exception as e:
-        print(f"Ошибка [hide_img]: во время обработки изображения для {image_path}: {e}")
+        print(f"Ошибка [prepare_prize_images]: во время обработки изображения для {image_path}: {e}")
+        return False
 
-def create_collage(user_id, manager):
-    all_prize_filenames = manager.get_all_prize_images() 
-    won_prize_info = manager.get_winners_img(user_id) 
-
-    won_filenames_set = {x[0] for x in won_prize_info}
 
-    if not all_prize_filenames:
-        print("Нет призов в базе данных для создания коллажа.")
-        return None 
+def hide_img(img_name, img_dir=IMG_DIR, hidden_dir=HIDDEN_IMG_DIR, optimized_dir=OPTIMIZED_IMG_DIR):
+    # Создает пикселизированное превью приза (см. prepare_prize_images). Результат - get_hidden_img_path(img_name).
+    prepare_prize_images(img_name, img_dir, hidden_dir, optimized_dir)
 
-    images_for_collage = []
-    target_cell_size = (256, 256) 
 
-    for img_filename in all_prize_filenames:
-        img_path = ''
-        if img_filename in won_filenames_set:
-            img_path = os.path.join('img', img_filename)
-        else:
-            hide_img(img_filename)
-            img_path = os.path.join('hidden_img', img_filename)
+def ingest_prize_images(img_names, img_dir=IMG_DIR, hidden_dir=HIDDEN_IMG_DIR, optimized_dir=OPTIMIZED_IMG_DIR):
+    # Подготавливает версии для всего каталога, чтобы первая рассылка и /my_score не ждали обработки изображений.
+    prepared = sum(1 for img_name in img_names if prepare_prize_images(img_name, img_dir, hidden_dir, optimized_dir))
+    print(f"Подготовлено изображений призов: {prepared} из {len(img_names)}.")
 
-        img = None
-        if os.path.exists(img_path):
-            img = cv2.imread(img_path)
 
-        if img is None:
-            print(f"Предупреждение: Не удалось загрузить изображение для коллажа: {img_path}. Использование черного плейсхолдера.")
-            img = np.zeros((*target_cell_size, 3), dtype=np.uint8)
-        else:
-            img = cv2.resize(img, target_cell_size, interpolation=cv2.INTER_AREA)
+COLLAGE_MAX_TILE = 256   # Максимальный размер ячейки коллажа в пикселях
+COLLAGE_MIN_TILE = 64    # Меньше ячейки не уменьшаются: вместо этого коллаж делится на страницы
+COLLAGE_MAX_SIDE = 2560  # Максимальная сторона страницы коллажа (у Telegram ширина + высота фото не больше 10000)
 
-        images_for_collage.append(img)
 
-    num_images = len(images_for_collage)
-    if num_images == 0:
-        return None 
+def collage_layout(num_images):
+    # Подбирает размер ячейки под размер каталога: чем больше призов, тем мельче ячейки, пока не достигнут COLLAGE_MIN_TILE.
+    # Возвращает (размер ячейки, максимум ячеек в строке/столбце страницы).
+    side = max(1, math.ceil(math.sqrt(num_images)))
+    tile = max(COLLAGE_MIN_TILE, min(COLLAGE_MAX_TILE, COLLAGE_MAX_SIDE // side))
+    return tile, COLLAGE_MAX_SIDE // tile
 
-    num_cols = math.floor(math.sqrt(num_images))
-    if num_cols == 0: 
-        num_cols = 1
-    num_rows = math.ceil(num_images / num_cols)
 
-    cell_height, cell_width, _ = images_for_collage[0].shape
+def iter_collage_pages(user_id, manager, img_dir=IMG_DIR, hidden_dir=HIDDEN_IMG_DIR, optimized_dir=OPTIMIZED_IMG_DIR):
+    # Генератор страниц коллажа. Каждая страница собирается построчно в заранее выделенный буфер,
+    # а изображения призов читаются по одному, поэтому пиковая память не зависит от размера каталога.
+    all_prize_filenames = manager.get_all_prize_images() 
+    won_prize_info = manager.get_winners_img(user_id) 
 
-    collage_width = num_cols * cell_width
-    collage_height = num_rows * cell_height
-    collage = np.zeros((collage_height, collage_width, 3), dtype=np.uint8)
+    won_filenames_set = {x[0] for x in won_prize_info}
 
-    for i, image in enumerate(images_for_collage):
-        row = i // num_cols
-        col = i % num_cols
+    if not all_prize_filenames:
+        print("Нет призов в базе данных для создания коллажа.")
+        return
 
-        if image.shape[0] != cell_height or image.shape[1] != cell_width:
-             image = cv2.resize(image, (cell_width, cell_height), interpolation=cv2.INTER_AREA)
+    tile, tiles_per_side = collage_layout(len(all_prize_filenames))
+    target_cell_size = (tile, tile)
+    page_capacity = tiles_per_side * tiles_per_side
 
-        collage[row * cell_height:(row + 1) * cell_height,
-                col * cell_width:(col + 1) * cell_width] = image
+    for page_start in range(0, len(all_prize_filenames), page_capacity):
+        page_filenames = all_prize_filenames[page_start:page_start + page_capacity]
+        num_images = len(page_filenames)
 
-    return collage
+        num_cols = max(math.floor(math.sqrt(num_images)), math.ceil(num_images / tiles_per_side))
+        num_rows = math.ceil(num_images / num_cols)
 
+        collage = np.zeros((num_rows * tile, num_cols * tile, 3), dtype=np.uint8)
 
-# --- Блок для отдельного тестирования logic.py ---
-# Здесь вы можете проверить работу logic.py, используя отдельную БД (Во время теста в папке созздастся файл test_collage_101.png, его можно удалить после окончания теста.)
+        for i, img_filename in enumerate(page_filenames):
+            img_path = ''
+            if img_filename in won_filenames_set:
+                img_path = get_prize_img_path(img_filename, img_dir, optimized_dir)
+            else:
+                hide_img(img_filename, img_dir, hidden_dir, optimized_dir)
+                img_path = get_hidden_img_path(img_filename, hidden_dir)
 
-if __name__ == '__main__':
-    print("--- Запуск тестирования logic.py ---")
+            img = None
+            if os.path.exists(img_path):
+                img = cv2.imread(img_path)
 
-    TEST_DATABASE = 'test_telegram_bot.db'
-    PRIZE_LIMIT_TEST = 3
+            if img is None:
+                print(f"Предупреждение: Не удалось загрузить изображение для коллажа: {img_path}. Использование черного плейсхолдера.")
+                continue
 
-    if os.path.exists(TEST_DATABASE):
-        try:
-            os.remove(TEST_DATABASE)
-            print(f"Удалена старая тестовая база данных: {TEST_DATABASE}")
-        except OSError as e:
-            print(f"Ошибка при удалении старой тестовой базы данных {TEST_DATABASE}: {e}")
+            row = i // num_cols
+            col = i % num_cols
+            collage[row * tile:(row + 1) * tile,
+                    col * tile:(col + 1) * tile] = cv2.resize(img, target_cell_size, interpolation=cv2.INTER_AREA)
 
-    img_dir = 'img'
-    if not os.path.exists(img_dir):
-        os.makedirs(img_dir)
-        print(f"Создан каталог '{img_dir}'. Пожалуйста, добавьте файлы изображений (.png, .jpg) в него.")
+        yield collage
 
-    fake_prizes_list = ['fake_prize_1.png', 'fake_prize_2.jpg', 'fake_prize_3.png', 'fake_prize_4.jpg', 'fake_prize_5.png', 'fake_prize_6.png', 'fake_prize_7.jpg']
-    has_real_images = any(f.lower().endswith(('.png', '.jpg', '.jpeg')) for f in os.listdir(img_dir) if os.path.isfile(os.path.join(img_dir, f)))
 
-    if not has_real_images:
-        print(f"Каталог '{img_dir}' не содержит стандартных изображений. Создаем фиктивные файлы для тестирования призов.")
+def create_collage(user_id, manager):
+    # Первая страница коллажа (при каталоге до нескольких сотен призов - весь коллаж). Для больших каталогов используйте iter_collage_pages.
+    return next(iter_collage_pages(user_id, manager), None)
+
+
+class Campaign:
+    # Отдельный розыгрыш: свое хранилище и каталог призов, свой лимит победителей, расписание и аудитория.
+    # Несколько кампаний работают в одном процессе (см. bot.py) и делят потоки отправки, ограничитель скорости и кэш изображений.
+
+    def __init__(self, name, storage, img_dir=IMG_DIR, hidden_dir=None, optimized_dir=None, interval_minutes=30, audience=None):
+        if not name or ':' in name:
+            raise ValueError(f"Некорректное имя розыгрыша: '{name}'. Имя не может быть пустым или содержать ':'.")
+        self.name = name
+        self.storage = storage
+        self.img_dir = img_dir
+        # Основной каталог 'img' использует прежние каталоги версий, остальные - подкаталоги с именем кампании
+        if hidden_dir is None:
+            hidden_dir = HIDDEN_IMG_DIR if img_dir == IMG_DIR else os.path.join(HIDDEN_IMG_DIR, name)
+        if optimized_dir is None:
+            optimized_dir = OPTIMIZED_IMG_DIR if img_dir == IMG_DIR else os.path.join(OPTIMIZED_IMG_DIR, name)
+        self.hidden_dir = hidden_dir
+        self.optimized_dir = optimized_dir
+        self.interval_minutes = interval_minutes
+        self.audience = set(audience) if audience is not None else None # None - все пользователи
+
+        self.claim_guard = ClaimGuard(debounce_seconds=1.0)
+        self.registrations = RegistrationBatcher(storage)
+        self.claim_batcher = ClaimBatcher(storage, window=0.05)
+        self.maintenance = DatabaseMaintenance(storage) if isinstance(storage, DatabaseManager) else None
+
+    @property
+    def prize_limit(self):
+        return self.storage.prize_limit
+
+    def accepts(self, user_id):
+        return self.audience is None or user_id in self.audience
+
+    def callback_data(self, prize_id):
+        return f'{self.name}:{prize_id}'
+
+    def register_claim(self, user_id, prize_id):
+        # Нажатие "Получить!" проходит ClaimGuard и, если нужно, встает в пачку ClaimBatcher. Вызывается в потоке поллинга,
+        # чтобы порядок нажатий определялся порядком обновлений. Возвращает Future со статусом в терминах add_winner
+        # или -3 (нажатие проигнорировано, см. ClaimGuard).
+        status = self.claim_guard.begin(user_id, prize_id)
+        if status is not None:
+            future = Future()
+            future.set_result(status)
+            return future
+
+        future = self.claim_batcher.submit(user_id, prize_id)
+        future.add_done_callback(lambda done: self.claim_guard.finish(user_id, prize_id, done.result()))
+        return future
+
+    def prize_img_path(self, img_name):
+        return get_prize_img_path(img_name, self.img_dir, self.optimized_dir)
+
+    def hidden_img_path(self, img_name):
+        return get_hidden_img_path(img_name, self.hidden_dir)
+
+    def prepare_prize_images(self, img_name):
+        return prepare_prize_images(img_name, self.img_dir, self.hidden_dir, self.optimized_dir)
+
+    def iter_collage_pages(self, user_id):
+        return iter_collage_pages(user_id, self.storage, self.img_dir, self.hidden_dir, self.optimized_dir)
+
+    def load_prizes(self):
+        # Добавляет призы из img_dir в пустое хранилище и в фоне готовит версии изображений.
+        img_dir = self.img_dir
         try:
-            for fname in fake_prizes_list:
-                fpath = os.path.join(img_dir, fname)
-                dummy_image = np.zeros((10, 10, 3), dtype=np.uint8)
-                cv2.imwrite(fpath, dummy_image)
-            print(f"Созданы фиктивные файлы призов в '{img_dir}'.")
-        except ImportError:
-            print("Numpy не найден. Невозможно создать фиктивные изображения.")
-        except Exception as e:
-            print(f"Ошибка при создании фиктивных изображений: {e}")
-    else:
-        print(f"Каталог '{img_dir}' содержит файлы изображений. Используем их.")
-
+            if os.path.exists(img_dir):
+                prizes_img = [f for f in os.listdir(img_dir) if os.path.isfile(os.path.join(img_dir, f)) and f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+                data = [(x,) for x in prizes_img]
 
-    manager = DatabaseManager(TEST_DATABASE)
+                if data:
+                    self.storage.add_prize(data)
+                    threading.Thread(target=ingest_prize_images, args=(prizes_img, img_dir, self.hidden_dir, self.optimized_dir), daemon=True).start()
+                else:
+                    print(f"[{self.name}] Каталог '{img_dir}' пуст или не содержит файлов изображений (.png, .jpg, .jpeg). Призы не добавлены.")
+            else:
+                print(f"[{self.name}] Ошибка: Каталог '{img_dir}' не найден. Призы не могут быть добавлены. Создайте каталог '{img_dir}' и поместите туда изображения.")
 
-    print("\nНастройка базы данных...")
+        except Exception as e:
+            print(f"[{self.name}] Произошла ошибка при добавлении призов из каталога '{img_dir}': {e}")
+
+
+def create_campaign(settings, storage_kind='sqlite'):
+    # settings - словарь из CAMPAIGNS в config.py. Обязателен только 'name'; остальные ключи:
+    # 'database', 'history_database', 'storage', 'img_dir', 'hidden_dir', 'optimized_dir', 'prize_limit', 'interval_minutes', 'audience'.
+    database = settings.get('database')
+    history_database = settings.get('history_database')
+    if history_database is None and database:
+        history_database = f'{os.path.splitext(database)[0]}_history.db'
+
+    storage = create_storage(settings.get('storage', storage_kind), database, settings.get('prize_limit', PRIZE_LIMIT), history_database)
+    storage.create_tables()
+    return Campaign(
+        settings['name'],
+        storage,
+        img_dir=settings.get('img_dir', IMG_DIR),
+        hidden_dir=settings.get('hidden_dir'),
+        optimized_dir=settings.get('optimized_dir'),
+        interval_minutes=settings.get('interval_minutes', 30),
+        audience=settings.get('audience'),
+    )
+
+
+def run_storage_conformance(manager, img_dir='img'):
+    # Общий набор проверок для реализаций Storage: одинаковая последовательность операций
+    # должна давать одинаковые результаты и в DatabaseManager, и в MemoryStorage.
+    PRIZE_LIMIT_TEST = manager.prize_limit
+
+    print("\nНастройка хранилища...")
     manager.create_tables()
-    print("Таблицы созданы/проверены (в тестовой БД).")
+    print("Хранилище подготовлено.")
 
     prizes_img = [f for f in os.listdir(img_dir) if os.path.isfile(os.path.join(img_dir, f)) and f.lower().endswith(('.png', '.jpg', '.jpeg'))]
     data = [(x,) for x in prizes_img]
@@ -415,20 +1451,23 @@ if __name__ == '__main__':
         added = manager.add_user(user_id, user_name)
         print(f"Попытка добавить пользователя ID {user_id} ('{user_name}'): {'Успех' if added else 'Уже существует'}")
 
+    print("\nДобавление пачки пользователей (add_users)...")
+    new_batch_ids = manager.add_users([(111, "Mallory"), (101, "Alice"), (112, "Niaj"), (111, "Mallory")])
+    print(f"Добавлены впервые: {new_batch_ids}")
+    assert new_batch_ids == {111, 112}, f"add_users должен вернуть только новых пользователей, получено {new_batch_ids}"
+    assert manager.add_users([(111, "Mallory")]) == set(), "Повторный add_users не должен добавлять пользователей"
+    assert manager.add_users([]) == set(), "add_users с пустым списком должен вернуть пустое множество"
+
     users_in_db = manager.get_users()
     print(f"Зарегистрированные ID пользователей: {users_in_db}")
+    assert sorted(users_in_db) == sorted(list(test_users) + [111, 112]), "get_users вернул не тех пользователей"
 
     print("\nСимулирование выигрышей...")
     available_prizes_raw = []
     available_prize_ids = []
-    with manager.lock:
-        conn = sqlite3.connect(manager.database)
-        with conn:
-            cur = conn.cursor()
-            cur.execute('SELECT prize_id, image FROM prizes')
-            available_prizes_raw = cur.fetchall()
-            available_prize_ids = [p[0] for p in available_prizes_raw]
-            print(f"Все ID призов для симуляции: {available_prize_ids}")
+    available_prizes_raw = manager.get_all_prizes()
+    available_prize_ids = [p[0] for p in available_prizes_raw]
+    print(f"Все ID призов для симуляции: {available_prize_ids}")
 
 
     simulated_prize_used_status = {}
@@ -519,6 +1558,21 @@ if __name__ == '__main__':
         assert actual_status == expected_status, f"Несоответствие для пользователя {user_id}, приза {prize_id_to_win}. Ожидалось {expected_status}, получено {actual_status}."
 
 
+    if len(available_prize_ids) >= 6:
+        prize_F = available_prize_ids[5]
+        print(f"\n--- Тестирование add_winners (пачка нажатий по Призу ID {prize_F}) ---")
+        batch_users = [103, 104, 103, 105, 106] # Charlie, David, Charlie повторно, Eve (3/3), Frank (лимит достигнут)
+        expected_batch = [1, 1, 0, 1, -1]
+        actual_batch = manager.add_winners(prize_F, batch_users)
+        print(f"  Результат add_winners: {actual_batch}")
+        assert actual_batch == expected_batch, f"Несоответствие в add_winners для приза {prize_F}. Ожидалось {expected_batch}, получено {actual_batch}."
+
+        for user_id in (103, 104, 105):
+            simulated_user_unique_wins.setdefault(user_id, set()).add(prize_F)
+            simulated_winners_count_by_prize[prize_F].add(user_id)
+        simulated_prize_used_status[prize_F] = True
+
+
     print("\n--- Тестирование метода get_winners_count ---")
     if available_prizes_raw:
         for prize_id, _ in available_prizes_raw:
@@ -585,12 +1639,172 @@ if __name__ == '__main__':
     else:
         print(f"Пользователь {user_id_for_test} не выиграл ни одного приза.")
 
+    print("\n--- Тестирование методов get_prize_img, mark_prize_used и get_random_prize ---")
+    for prize_id, image in available_prizes_raw:
+        assert manager.get_prize_img(prize_id) == image, f"get_prize_img вернул другое изображение для приза {prize_id}"
+    assert manager.get_prize_img(999999) is None, "get_prize_img для несуществующего приза должен вернуть None"
+    assert manager.get_all_prize_images() == [image for _, image in available_prizes_raw], "get_all_prize_images должен идти по prize_id"
+
+    # Разыгрываем оставшиеся призы по одному: get_random_prize не должен возвращать приз после mark_prize_used
+    unused_prize_ids = {prize_id for prize_id, used in simulated_prize_used_status.items() if not used}
+    while unused_prize_ids:
+        random_prize = manager.get_random_prize()
+        assert random_prize is not None, f"get_random_prize вернул None, хотя свободны призы {unused_prize_ids}"
+        prize_id, image = random_prize
+        assert prize_id in unused_prize_ids, f"get_random_prize вернул уже разыгранный приз {prize_id}"
+        assert image == manager.get_prize_img(prize_id)
+        manager.mark_prize_used(prize_id)
+        unused_prize_ids.discard(prize_id)
+        print(f"Приз ID {prize_id} помечен как использованный.")
+    assert manager.get_random_prize() is None, "После mark_prize_used всех призов get_random_prize должен вернуть None"
+
+
+# --- Блок для отдельного тестирования logic.py ---
+# Здесь вы можете проверить работу logic.py, используя отдельную БД (Во время теста в папке созздастся файл test_collage_101.png, его можно удалить после окончания теста.)
+
+if __name__ == '__main__':
+    from types import SimpleNamespace
+
+    print("--- Запуск тестирования logic.py ---")
+
+    TEST_DATABASE = 'test_telegram_bot.db'
+    TEST_HISTORY_DATABASE = 'test_telegram_bot_history.db'
+    for test_db in (TEST_DATABASE, TEST_HISTORY_DATABASE):
+        if os.path.exists(test_db):
+            try:
+                os.remove(test_db)
+                print(f"Удалена старая тестовая база данных: {test_db}")
+            except OSError as e:
+                print(f"Ошибка при удалении старой тестовой базы данных {test_db}: {e}")
+
+    img_dir = 'img'
+    if not os.path.exists(img_dir):
+        os.makedirs(img_dir)
+        print(f"Создан каталог '{img_dir}'. Пожалуйста, добавьте файлы изображений (.png, .jpg) в него.")
+
+    fake_prizes_list = ['fake_prize_1.png', 'fake_prize_2.jpg', 'fake_prize_3.png', 'fake_prize_4.jpg', 'fake_prize_5.png', 'fake_prize_6.png', 'fake_prize_7.jpg']
+    has_real_images = any(f.lower().endswith(('.png', '.jpg', '.jpeg')) for f in os.listdir(img_dir) if os.path.isfile(os.path.join(img_dir, f)))
+
+    if not has_real_images:
+        print(f"Каталог '{img_dir}' не содержит стандартных изображений. Создаем фиктивные файлы для тестирования призов.")
+        try:
+            for fname in fake_prizes_list:
+                fpath = os.path.join(img_dir, fname)
+                dummy_image = np.zeros((10, 10, 3), dtype=np.uint8)
+                cv2.imwrite(fpath, dummy_image)
+            print(f"Созданы фиктивные файлы призов в '{img_dir}'.")
+        except ImportError:
+            print("Numpy не найден. Невозможно создать фиктивные изображения.")
+        except Exception as e:
+            print(f"Ошибка при создании фиктивных изображений: {e}")
+    else:
+        print(f"Каталог '{img_dir}' содержит файлы изображений. Используем их.")
+
+
+    sqlite_manager = DatabaseManager(TEST_DATABASE, history_database=TEST_HISTORY_DATABASE)
+    memory_manager = MemoryStorage()
+
+    for storage in (sqlite_manager, memory_manager):
+        print(f"\n=== Проверка хранилища {type(storage).__name__} ===")
+        run_storage_conformance(storage, img_dir)
+
+    print("\n--- Сравнение хранилищ ---")
+    assert sqlite_manager.get_all_prizes() == memory_manager.get_all_prizes(), "Списки призов в хранилищах различаются"
+    assert sorted(sqlite_manager.get_users()) == sorted(memory_manager.get_users()), "Списки пользователей в хранилищах различаются"
+    assert sqlite_manager.get_all_prize_images() == memory_manager.get_all_prize_images(), "Порядок изображений призов в хранилищах различается"
+    assert sqlite_manager.get_rating() == memory_manager.get_rating(), "Рейтинги в хранилищах различаются"
+    for user_id in sqlite_manager.get_users():
+        assert sqlite_manager.get_winners_img(user_id) == memory_manager.get_winners_img(user_id), f"Призы пользователя {user_id} в хранилищах различаются"
+        assert sqlite_manager.get_user_won_prizes_count(user_id) == memory_manager.get_user_won_prizes_count(user_id)
+    print("Хранилища вернули одинаковые результаты.")
+
+    print("\n--- Тестирование DatabaseMaintenance ---")
+    maintenance = DatabaseMaintenance(sqlite_manager, backup_dir='test_backups', keep_backups=1)
+    conn = sqlite3.connect(TEST_DATABASE)
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal', "База должна работать в режиме WAL"
+    conn.close()
+    backup_path = maintenance.backup()
+    assert backup_path and os.path.exists(backup_path), "Резервная копия не создана"
+    backup_manager = DatabaseManager(backup_path)
+    assert backup_manager.get_rating() == sqlite_manager.get_rating(), "Резервная копия отличается от базы"
+
+    rating_before = sqlite_manager.get_rating()
+    won_before = {user_id: sqlite_manager.get_winners_img(user_id) for user_id in sqlite_manager.get_users()}
+    winners_count_before = {prize_id: sqlite_manager.get_winners_count(prize_id) for prize_id, _ in sqlite_manager.get_all_prizes()}
+    conn = sqlite3.connect(TEST_DATABASE)
+    archived_winner = conn.execute('SELECT w.user_id, w.prize_id FROM winners w INNER JOIN prizes p ON w.prize_id = p.prize_id WHERE p.used = 1 LIMIT 1').fetchone()
+    conn.close()
+    archived_rows = maintenance.archive_finished_prizes()
+    print(f"Перенесено в архив строк winners: {archived_rows}")
+    assert sqlite_manager.get_rating() == rating_before, "Рейтинг изменился после архивирования"
+    for user_id, won in won_before.items():
+        assert sqlite_manager.get_winners_img(user_id) == won, f"Призы пользователя {user_id} изменились после архивирования"
+        assert sqlite_manager.get_user_won_prizes_count(user_id) == len(won), f"Счетчик призов пользователя {user_id} изменился после архивирования"
+    for prize_id, count in winners_count_before.items():
+        assert sqlite_manager.get_winners_count(prize_id) == count, f"Число победителей приза {prize_id} изменилось после архивирования"
+    if archived_winner:
+        assert sqlite_manager.add_winner(*archived_winner) == 0, "Повторное нажатие на архивный приз должно возвращать 0"
+        assert sqlite_manager.add_winners(archived_winner[1], [archived_winner[0]]) == [0], "add_winners должен учитывать архив"
+    assert maintenance.archive_finished_prizes() == 0, "Повторное архивирование не должно переносить строки"
+    maintenance.backup()
+    history_base = os.path.splitext(os.path.basename(TEST_HISTORY_DATABASE))[0]
+    assert any(f.startswith(f'{history_base}_') for f in os.listdir('test_backups')), "Резервная копия базы истории не создана"
+    print("Резервное копирование и архивирование не изменили данные пользователей.")
+
+    print("\n--- Тестирование ClaimBatcher (порядок нажатий) ---")
+    claim_storage = MemoryStorage(prize_limit=3)
+    claim_storage.add_prize([('claim_test.png',)])
+    claim_prize_id = claim_storage.get_all_prizes()[0][0]
+
+    # Номера приходят не по порядку и с задержкой внутри окна: приз должны получить три наименьших номера
+    claim_batcher = ClaimBatcher(claim_storage, window=0.1)
+    claim_futures = {}
+    for seq in [5, 3, 9, 1, 7, 2, 8]:
+        claim_futures[seq] = claim_batcher.submit(1000 + seq, claim_prize_id, seq)
+        time.sleep(0.01)
+    claim_winners = sorted(seq for seq, future in claim_futures.items() if future.result() == 1)
+    print(f"Приз получили номера: {claim_winners}")
+    assert claim_winners == [1, 2, 3], f"Приз должны получить наименьшие номера нажатий, получили {claim_winners}"
+
+    # Через UpdateDispatcher: рабочие потоки доходят до ожидания с разной задержкой (как после answer_callback_query),
+    # но приз получают первые по порядку обновлений
+    claim_storage = MemoryStorage(prize_limit=3)
+    claim_storage.add_prize([('claim_test.png',)])
+    claim_batcher = ClaimBatcher(claim_storage, window=0.05)
+    claim_results = {}
+
+    class SlowClaimBot:
+        def process_new_updates(self, updates):
+            call = updates[0].callback_query
+            time.sleep(random.uniform(0, 0.2))
+            claim_results[call.message.chat.id] = call.claim_future.result()
+
+    def register_test_claim(call):
+        call.claim_future = claim_batcher.submit(call.message.chat.id, claim_prize_id)
+
+    claim_dispatcher = UpdateDispatcher(SlowClaimBot(), workers=1, claim_workers=16, on_callback=register_test_claim)
+    click_order = [2005, 2003, 2009, 2001, 2007, 2002, 2008, 2004, 2006]
+    claim_dispatcher.dispatch([
+        SimpleNamespace(update_id=update_id, callback_query=SimpleNamespace(message=SimpleNamespace(chat=SimpleNamespace(id=user_id))))
+        for update_id, user_id in enumerate(click_order)
+    ])
+    deadline = time.monotonic() + 5
+    while len(claim_results) < len(click_order) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    dispatcher_winners = [user_id for user_id in click_order if claim_results.get(user_id) == 1]
+    print(f"Приз получили пользователи: {dispatcher_winners}")
+    assert dispatcher_winners == click_order[:3], f"Приз должны получить первые нажавшие {click_order[:3]}, получили {dispatcher_winners}"
+
+    manager = sqlite_manager
+    prizes_img = [f for f in os.listdir(img_dir) if os.path.isfile(os.path.join(img_dir, f)) and f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+    user_id_for_test = 101 # Alice
+
     print("\n--- Тестирование hide_img (базовое) ---")
     if prizes_img:
         first_prize_img_name = prizes_img[0]
         print(f"Попытка создать скрытое изображение для '{first_prize_img_name}'...")
         hide_img(first_prize_img_name)
-        hidden_path = f'hidden_img/{first_prize_img_name}'
+        hidden_path = get_hidden_img_path(first_prize_img_name)
         if os.path.exists(hidden_path):
             print(f"Успешно создано скрытое изображение: {hidden_path}")
         else:
@@ -613,4 +1827,4 @@ if __name__ == '__main__':
 
 
     print("\n--- Тестирование logic.py завершено ---")
-    print(f"Тесты использовали базу данных: {TEST_DATABASE}")
+    print(f"Тесты использовали базу данных: {TEST_DATABASE} (архив: {TEST_HISTORY_DATABASE}, резервные копии: test_backups/)")